@@ -1,136 +1,191 @@
 #!/usr/bin/env python3
+import os
 import sys
-from pathlib import Path
 import re
 import subprocess
-from datetime import datetime
-
-root = Path('/workspaces/Firsttry/atlassian/forge-app')
-if len(sys.argv) < 2:
-    print('Usage: anchor_fix.py OUTDIR')
-    sys.exit(1)
-OUT = Path(sys.argv[1])
-OUT.mkdir(parents=True, exist_ok=True)
-
-# 0) snapshot git status
-with (OUT/'00_status.txt').open('w') as f:
-    f.write(subprocess.run(['git','-C',str(root.parent),'status','--porcelain=v1'], stdout=subprocess.PIPE).stdout.decode())
-    f.write('\n')
-    f.write(subprocess.run(['git','-C',str(root.parent),'diff','--name-only'], stdout=subprocess.PIPE).stdout.decode())
-
-# 1) audit .d.ts
-with (OUT/'01_dts_audit.txt').open('w') as f:
-    for p in root.glob('src/**/*.d.ts'):
-        try:
-            f.write(str(p.relative_to(root))+'\n')
-        except Exception:
-            f.write(str(p)+'\n')
-
-shim = root/'src/types/forge-shims.d.ts'
-if shim.exists():
-    s = shim.read_text(errors='replace')
-    forbidden = re.search(r'declare global|interface Window|\bdocument\b|\bwindow\b|namespace JSX|HTMLElement|React\.', s)
-    if forbidden:
-        with (OUT/'01_dts_audit.txt').open('a') as f:
-            f.write(f'ERROR: forbidden content in {shim}\n')
-            for m in re.finditer(r'.{0,60}(declare global|interface Window|\bdocument\b|\bwindow\b|namespace JSX|HTMLElement|React\.).{0,60}', s):
-                f.write(m.group(0)+'\n')
-        print('Forbidden shim content found; aborting', file=sys.stderr)
-        sys.exit(2)
-    if not re.search(r'^\s*declare module ', s, re.M):
-        with (OUT/'01_dts_audit.txt').open('a') as f:
-            f.write('ERROR: shim does not contain module declarations\n')
-            f.write(s[:200])
-        print('Shim invalid; aborting', file=sys.stderr)
-        sys.exit(3)
-
-# 2) run typecheck
-print('Running type-check...')
-with (OUT/'typecheck_before.txt').open('wb') as fh:
-    proc = subprocess.run(['npm','run','type-check'], cwd=str(root), stdout=fh, stderr=subprocess.STDOUT)
-
-# 3) extract anchors
-text = (OUT/'typecheck_before.txt').read_text(errors='replace')
-anchor_lines = [ln for ln in text.splitlines() if re.search(r'error TS|Cannot find module|TS2578|TS2307|TS2362|TS2552|TS6133', ln)]
-(OUT/'03_anchors_before.txt').write_text('\n'.join(anchor_lines[:200]))
-
-# 4A) Remove @ts-expect-error lines for listed TS2578 anchors (up to 20)
-pattern_2578 = re.compile(r"^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2578")
-hits_2578 = []
-for ln in anchor_lines:
-    m = pattern_2578.search(ln)
-    if m:
-        hits_2578.append((m.group(1), int(m.group(2))))
-hits_2578 = hits_2578[:20]
-removed = []
-for file, lineno in hits_2578:
-    p = root/file
-    if not p.exists():
-        continue
-    lines = p.read_text(errors='replace').splitlines(True)
-    idx = lineno - 1
-    if 0 <= idx < len(lines) and '@ts-expect-error' in lines[idx]:
-        lines.pop(idx)
-        p.write_text(''.join(lines), encoding='utf-8')
-        removed.append((file, lineno))
-(OUT/'04a_ts2578.txt').write_text('\n'.join([f"REMOVED {f} line {l}" for f,l in removed]))
-
-# 4B) Fix missing relative module imports if target exists (up to 15)
-pattern_2307 = re.compile(r"^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2307: Cannot find module '([^']+)'")
-hits_2307 = []
-for ln in anchor_lines:
-    m = pattern_2307.search(ln)
-    if m:
-        hits_2307.append((m.group(1), m.group(4)))
-fixed = []
-skipped = []
-count=0
-for file, mod in hits_2307:
-    if not mod.startswith('.'):
-        skipped.append((file, mod, 'non-relative'))
-        continue
-    count += 1
-    if count > 15:
-        break
+from collections import defaultdict, deque
+from itertools import islice
+from pathlib import Path
+
+from forge_fix_common import (
+    root, iter_anchors, parse_ts2578, parse_ts2307, resolve_module, _read,
+    atomic_write, remove_expect_errors, edit_file_batched, run_tsc_stream,
+    start_tsc_driver, driver_pass, stop_tsc_driver,
+)
+
+FORBIDDEN_RE = re.compile(r'declare global|interface Window|\bdocument\b|\bwindow\b|namespace JSX|HTMLElement|React\.')
+FORBIDDEN_CTX_RE = re.compile(r'.{0,60}(declare global|interface Window|\bdocument\b|\bwindow\b|namespace JSX|HTMLElement|React\.).{0,60}')
+MODULE_DECL_RE = re.compile(r'^\s*declare module ', re.M)
+
+
+def rewrite_imports(item):
+    # apply all import rewrites for one file with a single read/write and a
+    # single scan: one compiled alternation of every quoted module specifier
+    file, fixes = item
+    fixes = [(mod, new_mod) for mod, new_mod in dict.fromkeys(fixes) if mod != new_mod]
+    if not fixes:
+        return []
+    mapping = {}
+    for mod, new_mod in fixes:
+        mapping[f"'{mod}'"] = f"'{new_mod}'"
+        mapping[f'"{mod}"'] = f'"{new_mod}"'
+    pat = re.compile('|'.join(map(re.escape, mapping)))
+    seen = set()
+
+    def repl(m):
+        seen.add(m.group(0))
+        return mapping[m.group(0)]
+
     src_path = root/file
-    base = src_path.parent
-    cand = (base / mod)
-    options = [cand.with_suffix('.ts'), cand.with_suffix('.tsx'), cand / 'index.ts', cand / 'index.tsx']
-    exists = None
-    for o in options:
-        if o.exists():
-            exists = o
+    ptext = _read(src_path)
+    ptext2 = pat.sub(repl, ptext)
+    if ptext2 != ptext:
+        atomic_write(src_path, ptext2)
+    return [(file, mod, new_mod) for mod, new_mod in fixes if f"'{mod}'" in seen or f'"{mod}"' in seen]
+
+
+def find_dts(top):
+    # os.scandir walk: only matching .d.ts files become strings, no Path per entry
+    stack = [top]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                elif e.name.endswith('.d.ts'):
+                    yield e.path
+
+
+def main(out):
+    out.mkdir(parents=True, exist_ok=True)
+
+    # 0) snapshot git status; a clean tree (the usual case) has nothing for
+    # `git diff --name-only` to list, so that second git process is skipped
+    status_out = subprocess.run(['git','-C',str(root.parent),'status','--porcelain=v1'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE).stdout
+    with (out/'00_status.txt').open('w') as f:
+        f.write(status_out.decode())
+        f.write('\n')
+        if status_out.strip():
+            f.write(subprocess.run(['git','-C',str(root.parent),'diff','--name-only'], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE).stdout.decode())
+
+    # 1) audit .d.ts
+    with (out/'01_dts_audit.txt').open('w') as f:
+        for p in find_dts(os.path.join(root, 'src')):
+            f.write(os.path.relpath(p, root)+'\n')
+
+    shim = root/'src/types/forge-shims.d.ts'
+    if shim.exists():
+        s = shim.read_text(errors='replace')
+        forbidden = FORBIDDEN_RE.search(s)
+        if forbidden:
+            with (out/'01_dts_audit.txt').open('a') as f:
+                f.write(f'ERROR: forbidden content in {shim}\n')
+                for m in FORBIDDEN_CTX_RE.finditer(s):
+                    f.write(m.group(0)+'\n')
+            print('Forbidden shim content found; aborting', file=sys.stderr)
+            sys.exit(2)
+        if not MODULE_DECL_RE.search(s):
+            with (out/'01_dts_audit.txt').open('a') as f:
+                f.write('ERROR: shim does not contain module declarations\n')
+                f.write(s[:200])
+            print('Shim invalid; aborting', file=sys.stderr)
+            sys.exit(3)
+
+    # 2) run typecheck and 3) extract anchors, TS2578 and TS2307 hits while it streams
+    # (scan the raw bytes; only matched paths/modules are decoded)
+    print('Running type-check...')
+    driver = start_tsc_driver()
+    n_anchors = 0
+    hits_2578 = []
+    hits_2307 = []
+    with (out/'typecheck_before.txt').open('wb') as fh, (out/'03_anchors_before.txt').open('wb') as af:
+        lines = driver_pass(driver, fh) if driver else run_tsc_stream(fh)
+        for ln in iter_anchors(lines):
+            if n_anchors < 200:
+                af.write(ln + b'\n')
+            n_anchors += 1
+            hit = parse_ts2578(ln)
+            if hit:
+                hits_2578.append(hit)
+                continue
+            hit = parse_ts2307(ln)
+            if hit:
+                hits_2307.append(hit)
+
+    # 4A) Remove @ts-expect-error lines for listed TS2578 anchors (up to 20)
+    # grouped per file (as remove_ts_expect.py does) so each file is read/written once
+    hits_2578 = hits_2578[:20]
+    byfile = defaultdict(list)
+    for f, l in hits_2578:
+        byfile[f].append(l)
+    removed = [r for rs in edit_file_batched(remove_expect_errors, byfile.items()) for r in rs]
+    with (out/'04a_ts2578.txt').open('w') as f:
+        for file, lineno in removed:
+            f.write(f"REMOVED {file} line {lineno}\n")
+
+    # 4B) Fix missing relative module imports if target exists (up to 15)
+    skipped = []
+    imports_byfile = defaultdict(list)
+    count=0
+    for file, mod in hits_2307:
+        if not mod.startswith('.'):
+            skipped.append((file, mod, 'non-relative'))
+            continue
+        count += 1
+        if count > 15:
             break
-    if exists:
-        rel = exists.relative_to(base)
-        rel_no_ext = str(rel).replace('\\','/')
-        for ext in ['.ts','.tsx']:
-            if rel_no_ext.endswith(ext):
-                rel_no_ext = rel_no_ext[:-len(ext)]
-        if rel_no_ext.endswith('/index'):
-            rel_no_ext = rel_no_ext[:-len('/index')]
-        new_mod = './' + rel_no_ext if not rel_no_ext.startswith('.') else rel_no_ext
-        ptext = src_path.read_text(errors='replace')
-        ptext2 = ptext.replace(f"'{mod}'", f"'{new_mod}'").replace(f'\"{mod}\"', f'\"{new_mod}\"')
-        if ptext2 != ptext:
-            src_path.write_text(ptext2, encoding='utf-8')
-            fixed.append((file, mod, new_mod))
-    else:
-        skipped.append((file, mod, 'target-missing'))
-
-with (OUT/'04b_ts2307.txt').open('w') as f:
-    for t in fixed:
-        f.write(f"FIXED import: {t[0]} {t[1]} -> {t[2]}\n")
-    for t in skipped[:50]:
-        f.write(f"SKIP: {t[0]} {t[1]} ({t[2]})\n")
-
-# 5) re-run typecheck
-with (OUT/'typecheck_after.txt').open('wb') as fh:
-    proc2 = subprocess.run(['npm','run','type-check'], cwd=str(root), stdout=fh, stderr=subprocess.STDOUT)
-
-text2 = (OUT/'typecheck_after.txt').read_text(errors='replace')
-anchor_lines2 = [ln for ln in text2.splitlines() if re.search(r'error TS|Cannot find module|TS2578|TS2307|TS2362|TS2552|TS6133', ln)]
-(OUT/'06_remaining.txt').write_text('\n'.join(anchor_lines2[:220]))
-
-print('OUT=' + str(OUT))
-print('DONE')
+        src_path = root/file
+        base = src_path.parent
+        cand = (base / mod)
+        exists = resolve_module(cand)
+        if exists:
+            rel = exists.relative_to(base)
+            rel_no_ext = str(rel).replace('\\','/')
+            for ext in ['.ts','.tsx']:
+                if rel_no_ext.endswith(ext):
+                    rel_no_ext = rel_no_ext[:-len(ext)]
+            if rel_no_ext.endswith('/index'):
+                rel_no_ext = rel_no_ext[:-len('/index')]
+            new_mod = './' + rel_no_ext if not rel_no_ext.startswith('.') else rel_no_ext
+            imports_byfile[file].append((mod, new_mod))
+        else:
+            skipped.append((file, mod, 'target-missing'))
+
+    fixed = [t for ts in edit_file_batched(rewrite_imports, imports_byfile.items()) for t in ts]
+
+    with (out/'04b_ts2307.txt').open('w') as f:
+        for t in fixed:
+            f.write(f"FIXED import: {t[0]} {t[1]} -> {t[2]}\n")
+        for t in skipped[:50]:
+            f.write(f"SKIP: {t[0]} {t[1]} ({t[2]})\n")
+
+    # 5) re-run typecheck: the driver's second pass is requested only now, after
+    # all of step 4's edits, and rechecks just what they changed
+    # only the first 220 anchors are reported: stop filtering once islice has them,
+    # then just drain the rest of tsc's output into the log
+    with (out/'typecheck_after.txt').open('wb') as fh, (out/'06_remaining.txt').open('wb') as rf:
+        if removed or fixed:
+            lines = driver_pass(driver, fh) if driver else run_tsc_stream(fh)
+        else:
+            # nothing was edited, so the "before" diagnostics are still current
+            data = (out/'typecheck_before.txt').read_bytes()
+            fh.write(data)
+            lines = iter(data.splitlines())
+        rf.writelines(ln + b'\n' for ln in islice(iter_anchors(lines), 220))
+        deque(lines, maxlen=0)
+    if driver:
+        stop_tsc_driver(driver)
+
+    print('OUT=' + str(out))
+    print('DONE')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: anchor_fix.py OUTDIR')
+        sys.exit(1)
+    main(Path(sys.argv[1]))
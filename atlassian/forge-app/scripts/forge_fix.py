@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Run the forge-app fix passes in one Python process.
+
+    forge_fix.py anchor OUTDIR
+    forge_fix.py remove OUTDIR
+    forge_fix.py mech [INPUT]
+    forge_fix.py all OUTDIR
+
+`all` runs anchor -> remove -> mech and writes mech's output to OUTDIR/mech.
+mech reads OUTDIR/typecheck_after.txt, or, when remove edited any file (which
+shifts the line numbers in that log), a fresh OUTDIR/typecheck_after_remove.txt.
+The phases share forge_fix_common's compiled patterns and directory-listing
+cache instead of rebuilding them per script.
+"""
+import sys
+from collections import deque
+from pathlib import Path
+
+import anchor_fix
+import mech_fix
+import remove_ts_expect
+from forge_fix_common import run_tsc_stream
+
+USAGE = 'Usage: forge_fix.py {anchor|remove|all} OUTDIR | forge_fix.py mech [INPUT]'
+
+
+def main(argv):
+    cmd = argv[0] if argv else None
+    if cmd == 'mech':
+        if len(argv) > 1:
+            mech_fix.main(Path(argv[1]))
+        else:
+            mech_fix.main()
+        return
+    if cmd not in ('anchor', 'remove', 'all') or len(argv) < 2:
+        print(USAGE)
+        sys.exit(1)
+    out = Path(argv[1])
+    if cmd in ('anchor', 'all'):
+        anchor_fix.main(out)
+    if cmd == 'remove':
+        remove_ts_expect.main(out)
+    if cmd == 'all':
+        mech_in = out/'typecheck_after.txt'
+        if remove_ts_expect.main(out):
+            # the removed lines make that log's line numbers stale; recheck
+            mech_in = out/'typecheck_after_remove.txt'
+            with mech_in.open('wb') as fh:
+                deque(run_tsc_stream(fh), maxlen=0)
+        mech_fix.main(mech_in, out/'mech')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,185 @@
+"""Shared pieces of the forge-app typecheck fix scripts.
+
+anchor_fix.py, remove_ts_expect.py and mech_fix.py all run tsc, parse its
+anchors and batch per-file edits; the code for that lives here. Running the
+passes through forge_fix.py imports it once, so compiled patterns and the
+directory-listing cache are shared across phases.
+"""
+import atexit
+import functools
+import os
+import re
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+root = Path('/workspaces/Firsttry/atlassian/forge-app')
+WORKERS = min(8, os.cpu_count() or 1)
+
+# Call tsc directly rather than through `npm run type-check`: skips the npm/node
+# wrapper boot for every typecheck pass.
+# The check is incremental: tsc keeps its .tsbuildinfo under node_modules/.cache
+# across runs, so later passes only recheck what the fixes edited. This needs
+# no tsconfig change -- `--incremental --noEmit` works with the plain
+# tsconfig.json; `tsc -b` would require "composite" project references and
+# emitting to dist, which a pure typecheck must not do.
+TSC = root/'node_modules/typescript/bin/tsc'
+TSBUILDINFO = root/'node_modules/.cache/forge-fix/typecheck.tsbuildinfo'
+TSC_CMD = ['node', str(TSC), '--noEmit', '--incremental', '--tsBuildInfoFile', str(TSBUILDINFO), '--pretty', 'false', '-p', str(root/'tsconfig.json')] if TSC.exists() else ['npm', 'run', 'type-check']
+# tsc_driver.cjs loads TypeScript once and runs one incremental check (same
+# options as TSC_CMD) per request on its stdin, so a before/after pair pays for
+# a single node + compiler boot. Unlike `tsc --watch`, a pass starts only when
+# asked for, so it always sees every edit made before the request.
+TSC_DRIVER_CMD = ['node', str(Path(__file__).resolve().with_name('tsc_driver.cjs')), str(root/'tsconfig.json'), str(TSBUILDINFO)] if TSC.exists() else None
+DRIVER_DONE = b'__forge_fix_pass_done__'
+
+ANCHOR_TOKENS = (b'error TS', b'Cannot find module', b'TS2578', b'TS2307', b'TS2362', b'TS2552', b'TS6133')
+TS2578_RE = re.compile(rb"^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2578", re.M)
+TS2307_RE = re.compile(rb"^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2307: Cannot find module '([^']+)'", re.M)
+
+
+def has_token(line, tokens=ANCHOR_TOKENS):
+    # the anchor filters are ORs of literals; plain substring tests are much
+    # cheaper than a regex alternation
+    return any(tok in line for tok in tokens)
+
+
+def iter_anchors(lines, tokens=ANCHOR_TOKENS):
+    for ln in lines:
+        if has_token(ln, tokens):
+            yield ln
+
+
+def parse_ts2578(ln):
+    # (file, line) of an unused @ts-expect-error, or None
+    m = TS2578_RE.match(ln)
+    if m:
+        return m.group(1).decode('utf-8', 'replace'), int(m.group(2))
+    return None
+
+
+def parse_ts2307(ln):
+    # (file, module) of an unresolved import, or None
+    m = TS2307_RE.match(ln)
+    if m:
+        return m.group(1).decode('utf-8', 'replace'), m.group(4).decode('utf-8', 'replace')
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def dir_entries(d):
+    # one listdir per directory instead of a stat() per candidate module path
+    try:
+        return frozenset(os.listdir(d))
+    except OSError:
+        return frozenset()
+
+
+def resolve_module(cand, exts=('.ts', '.tsx')):
+    for ext in exts:
+        o = cand.with_suffix(ext)
+        if o.name in dir_entries(o.parent):
+            return o
+    for index in ('index.ts', 'index.tsx'):
+        if index in dir_entries(cand):
+            return cand / index
+    return None
+
+
+def _read(p):
+    # whole-file bytes + one decode: skips read_text()'s TextIOWrapper layer
+    return p.read_bytes().decode('utf-8', 'replace')
+
+
+def _write(p, s):
+    p.write_bytes(s.encode('utf-8'))
+
+
+def atomic_write(p, data):
+    # write a sibling temp file and rename it over p, so an interrupted run
+    # never leaves a half-written source file behind; resolve symlinks first so
+    # the link target is rewritten rather than replaced, and keep p's mode bits
+    p = p.resolve()
+    tmp = p.with_suffix(p.suffix + '.tmp')
+    _write(tmp, data)
+    shutil.copymode(p, tmp)
+    os.replace(tmp, p)
+
+
+def remove_expect_errors(item):
+    # drop the flagged @ts-expect-error lines of one file; popping bottom-up
+    # keeps the remaining line numbers valid
+    file, linenos = item
+    p = root/file
+    if not p.exists():
+        return []
+    lines = _read(p).splitlines(True)
+    removed = []
+    for lineno in sorted(set(linenos), reverse=True):
+        idx = lineno - 1
+        if 0 <= idx < len(lines) and '@ts-expect-error' in lines[idx]:
+            lines.pop(idx)
+            removed.append((file, lineno))
+    if removed:
+        atomic_write(p, ''.join(lines))
+    return removed
+
+
+def edit_file_batched(func, items):
+    # each item covers one whole file (read/edit/write once), and files are
+    # independent, so they are edited on a thread pool; results keep item order
+    with ThreadPoolExecutor(max_workers=WORKERS) as ex:
+        return list(ex.map(func, items))
+
+
+def run_tsc_stream(fh):
+    # run tsc, tee its raw output into fh and yield each line as soon as it is
+    # emitted, so anchor parsing overlaps with the typecheck itself
+    proc = subprocess.Popen(TSC_CMD, cwd=str(root), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    with proc:
+        for ln in proc.stdout:
+            fh.write(ln)
+            yield ln.rstrip(b'\r\n')
+
+
+
+def start_tsc_driver():
+    # None means: fall back to one run_tsc_stream() per pass
+    if TSC_DRIVER_CMD is None:
+        return None
+    try:
+        proc = subprocess.Popen(TSC_DRIVER_CMD, cwd=str(root), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError:
+        return None
+    atexit.register(proc.kill)
+    return proc
+
+
+def driver_pass(proc, fh):
+    # request one check from the driver and tee its diagnostics into fh; the
+    # driver prints a whole pass at once, so nothing is lost by collecting it
+    # before the sentinel. If the driver died (typescript failed to load, a
+    # crash mid-check), fall back to a one-shot tsc run for this pass.
+    try:
+        proc.stdin.write(b'check\n')
+        proc.stdin.flush()
+    except OSError:
+        return run_tsc_stream(fh)
+    out = []
+    for ln in proc.stdout:
+        ln = ln.rstrip(b'\r\n')
+        if ln == DRIVER_DONE:
+            fh.writelines(l + b'\n' for l in out)
+            return iter(out)
+        out.append(ln)
+    return run_tsc_stream(fh)
+
+
+def stop_tsc_driver(proc):
+    # closing stdin ends the driver's read loop
+    try:
+        proc.stdin.close()
+    except OSError:
+        pass
+    proc.wait()
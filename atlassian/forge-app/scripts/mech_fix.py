@@ -2,123 +2,145 @@
 from pathlib import Path
 import re
 import sys
+from collections import deque
 from datetime import datetime
+from itertools import islice
 
-root=Path('/workspaces/Firsttry/atlassian/forge-app')
-IN=Path('/tmp/typecheck_after_shim_removal.txt')
-if not IN.exists():
-    print('Missing input', IN)
-    sys.exit(1)
-TS=datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-OUT=Path(f'/tmp/typecheck_mech_fix_{TS}')
-OUT.mkdir(parents=True, exist_ok=True)
+from forge_fix_common import (
+    root, TS2307_RE, iter_anchors, resolve_module, _read,
+    atomic_write, edit_file_batched, run_tsc_stream,
+)
 
-text=IN.read_text(errors='replace')
-# anchors
-pat_lines=re.compile(r'(error TS|Cannot find module|TS2362|TS2307|TS2552|TS2686|TS6133|TS2578|\.(ts|tsx)\()')
-anchors=[line for line in text.splitlines() if pat_lines.search(line)]
-with (OUT/'00_anchors.txt').open('w') as f:
-    f.write('\n'.join(anchors[:260]))
+REMAINING_TOKENS=(b'error TS',b'Cannot find module',b'TS2362',b'TS2307',b'TS2552',b'TS2686',b'TS6133',b'TS2578')
+ANCHOR_TOKENS=REMAINING_TOKENS+(b'.ts(',b'.tsx(')
+FILE_RE=re.compile(rb'(src/[^:(]+\.(?:ts|tsx))')
+TS2362_RE=re.compile(rb'^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2362', re.M)
+IMPORT_LINE_RE=re.compile(r'^import [^\n]*\n?', re.M)
+VIEW_IMPORT_RE=re.compile(r"import\s+\{[^}]*\bview\b[^}]*\}\s+from\s+['\"]@forge/ui['\"]")
 
-# files
-file_pat=re.compile(r'(src/[^:(]+\.(?:ts|tsx))')
-files=sorted(set(file_pat.findall('\n'.join(anchors)) ))
-# file_pat.findall returns tuples if groups; normalize
-files2=[]
-for m in file_pat.finditer('\n'.join(anchors)):
-    files2.append(m.group(1))
-files_sorted=sorted(set(files2))
-with (OUT/'01_files.txt').open('w') as f:
-    f.write('\n'.join(files_sorted))
+def ensure_import(txt, imp_line):
+    # insert after the last `import ` line within the first 80 lines (or at the
+    # top) with one slice, instead of a splitlines/join round-trip
+    if imp_line in txt:
+        return txt
+    head=0
+    for _ in range(80):
+        nl=txt.find('\n', head)
+        if nl<0:
+            head=len(txt)
+            break
+        head=nl+1
+    pos=0
+    for m in IMPORT_LINE_RE.finditer(txt, 0, head):
+        pos=m.end()
+    # _read keeps CRLF as-is, so end the new line the way the file does
+    nl='\r\n' if '\r\n' in txt else '\n'
+    return txt[:pos]+imp_line+nl+txt[pos:]
 
-# mechanical import fixes
-updated=[]
-for rel in files_sorted:
+# mechanical import fixes for one file
+def fix_imports(rel):
     p=root/rel
     if not p.exists():
-        continue
-    if p.suffix not in ('.ts','.tsx'):
-        continue
-    txt=p.read_text(encoding='utf-8', errors='replace')
+        return None
+    is_tsx=p.suffix=='.tsx'
+    if not is_tsx and p.suffix!='.ts':
+        return None
+    txt=_read(p)
     orig=txt
-    def ensure_import(txt, imp_line):
-        if imp_line in txt:
-            return txt
-        lines=txt.splitlines(True)
-        last_imp=-1
-        for i,l in enumerate(lines[:80]):
-            if l.startswith('import '):
-                last_imp=i
-        if last_imp>=0:
-            lines.insert(last_imp+1, imp_line+'\n')
-        else:
-            lines.insert(0, imp_line+'\n')
-        return ''.join(lines)
-    if p.suffix=='.tsx' and re.search(r"from\s+['\"]react['\"]", txt) is None:
+    # literal checks (the sources never vary the whitespace in these imports);
+    # VIEW_IMPORT_RE only runs for combined imports such as `{ view, Text }`
+    if is_tsx and 'from "react"' not in txt and "from 'react'" not in txt:
         txt=ensure_import(txt, 'import React from "react";')
-    uses_view = ('view(' in txt) or ('<' in txt and p.suffix=='.tsx' and 'src/admin' in str(p))
-    if uses_view and re.search(r"import\s+\{[^}]*\bview\b[^}]*\}\s+from\s+['\"]@forge/ui['\"]", txt) is None:
+    uses_view = ('view(' in txt) or ('<' in txt and is_tsx and 'src/admin' in str(p))
+    has_view_import = ('{ view } from "@forge/ui"' in txt or "{ view } from '@forge/ui'" in txt
+                       or ('@forge/ui' in txt and VIEW_IMPORT_RE.search(txt)))
+    if uses_view and not has_view_import:
         txt=ensure_import(txt, 'import { view } from "@forge/ui";')
     if txt!=orig:
-        p.write_text(txt, encoding='utf-8')
-        updated.append(rel)
-with (OUT/'02_import_fixes.txt').open('w') as f:
-    f.write('\n'.join(['UPDATED '+u for u in updated]))
+        atomic_write(p, txt)
+        return rel
+    return None
+
+IN=Path('/tmp/typecheck_after_shim_removal.txt')
+
+def main(in_path=IN, out=None):
+    if not in_path.exists():
+        print('Missing input', in_path)
+        sys.exit(1)
+    if out is None:
+        TS=datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        out=Path(f'/tmp/typecheck_mech_fix_{TS}')
+    out.mkdir(parents=True, exist_ok=True)
+
+    # scan the logs as raw bytes; only matched paths/modules are decoded
+    text=in_path.read_bytes()
+    # one pass over the anchors: the first 260 go to 00_anchors.txt, and the
+    # src paths on every anchor line (not the whole log: FILE_RE is unanchored
+    # and would also pick up e.g. "Imported via ..." explanations) are collected.
+    # The file set needs every anchor, so unlike the streamed 06 report below
+    # this loop cannot stop at the cap.
+    files=set()
+    with (out/'00_anchors.txt').open('wb') as f:
+        for n, ln in enumerate(iter_anchors(text.splitlines(), ANCHOR_TOKENS)):
+            if n<260:
+                f.write(ln+b'\n')
+            files.update(m.group(1).decode('utf-8', 'replace') for m in FILE_RE.finditer(ln))
+    files_sorted=sorted(files)
+    with (out/'01_files.txt').open('w') as f:
+        f.writelines(rel+'\n' for rel in files_sorted)
+
+    updated=[rel for rel in edit_file_batched(fix_imports, files_sorted) if rel]
+    with (out/'02_import_fixes.txt').open('w') as f:
+        f.writelines('UPDATED '+u+'\n' for u in updated)
 
-# TS2362 contexts: find first 3 files
-ts2362_pat=re.compile(r'^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2362', re.M)
-hits=[]
-for m in ts2362_pat.finditer(text):
-    hits.append((m.group(1), int(m.group(2))))
-seen=set(); sel=[]
-for f,ln in hits:
-    if f not in seen:
-        seen.add(f); sel.append((f,ln))
-    if len(sel)==3: break
-with (OUT/'03_ts2362.txt').open('w') as f:
-    f.write('TS2362_CONTEXT_FILES:\n')
-    for fpath,ln in sel:
-        p=root/fpath
-        if not p.exists():
-            f.write(f'MISSING {fpath}\n')
-            continue
-        lines=p.read_text(errors='replace').splitlines()
-        a=max(1, ln-30); b=min(len(lines), ln+30)
-        f.write(f'\n--- {fpath}:{ln} (context {a}-{b}) ---\n')
-        for i in range(a,b+1):
-            f.write(f"{i:>4} {lines[i-1]}\n")
+    # TS2362 contexts: find first 3 files
+    hits=[]
+    for m in TS2362_RE.finditer(text):
+        hits.append((m.group(1).decode('utf-8', 'replace'), int(m.group(2))))
+    seen=set(); sel=[]
+    for f,ln in hits:
+        if f not in seen:
+            seen.add(f); sel.append((f,ln))
+        if len(sel)==3: break
+    with (out/'03_ts2362.txt').open('w') as f:
+        f.write('TS2362_CONTEXT_FILES:\n')
+        for fpath,ln in sel:
+            p=root/fpath
+            if not p.exists():
+                f.write(f'MISSING {fpath}\n')
+                continue
+            lines=p.read_text(errors='replace').splitlines()
+            a=max(1, ln-30); b=min(len(lines), ln+30)
+            f.write(f'\n--- {fpath}:{ln} (context {a}-{b}) ---\n')
+            for i in range(a,b+1):
+                f.write(f"{i:>4} {lines[i-1]}\n")
 
-# Missing module verification
-with (OUT/'04_missing_modules.txt').open('w') as f:
-    ts2307_pat=re.compile(r"^(src/[^:(]+\.(?:ts|tsx))\((\d+),(\d+)\): error TS2307: Cannot find module '([^']+)'", re.M)
-    cnt=0
-    for m in ts2307_pat.finditer(text):
-        file=m.group(1); mod=m.group(4)
-        cnt+=1
-        if cnt>50: break
-        if mod.startswith('.'):
-            base=(root/file).parent
-            cand=(base/mod)
-            exists=False
-            for ext in ['.ts','.tsx','.js','.cjs','.mjs']:
-                if (cand.with_suffix(ext)).exists(): exists=True; break
-            if (cand/'index.ts').exists() or (cand/'index.tsx').exists(): exists=True
-            f.write(f"{file} -> {mod} ; resolved={cand} ; exists={exists}\n")
-        else:
-            f.write(f"{file} -> {mod} ; non-relative (do not auto-fix)\n")
+    # Missing module verification
+    with (out/'04_missing_modules.txt').open('w') as f:
+        cnt=0
+        for m in TS2307_RE.finditer(text):
+            file=m.group(1).decode('utf-8', 'replace'); mod=m.group(4).decode('utf-8', 'replace')
+            cnt+=1
+            if cnt>50: break
+            if mod.startswith('.'):
+                base=(root/file).parent
+                cand=(base/mod)
+                exists=resolve_module(cand, ('.ts','.tsx','.js','.cjs','.mjs')) is not None
+                f.write(f"{file} -> {mod} ; resolved={cand} ; exists={exists}\n")
+            else:
+                f.write(f"{file} -> {mod} ; non-relative (do not auto-fix)\n")
 
-# Re-run tsc
-import subprocess
-out_file=OUT/'typecheck_after_mech.txt'
-with out_file.open('w') as fh:
-    proc=subprocess.run(['npm','run','type-check'], cwd=str(root), stdout=fh, stderr=subprocess.STDOUT)
+    # Re-run tsc and collect remaining anchors while it streams
+    out_file=out/'typecheck_after_mech.txt'
+    with out_file.open('wb') as fh, (out/'06_remaining_anchors.txt').open('wb') as f:
+        lines=run_tsc_stream(fh)
+        f.writelines(ln+b'\n' for ln in islice(iter_anchors(lines, REMAINING_TOKENS), 220))
+        # drain the rest of tsc's output into the log without filtering it
+        deque(lines, maxlen=0)
 
-# collect remaining anchors
-with (OUT/'06_remaining_anchors.txt').open('w') as f:
-    t=out_file.read_text(errors='replace')
-    pat2=re.compile(r'(error TS|Cannot find module|TS2362|TS2307|TS2552|TS2686|TS6133|TS2578)')
-    lines=[ln for ln in t.splitlines() if pat2.search(ln)]
-    f.write('\n'.join(lines[:220]))
+    print('OUT='+str(out))
+    print('DONE')
+    return out
 
-print('OUT='+str(OUT))
-print('DONE')
+if __name__=='__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env node
+/**
+ * Long-lived typecheck worker for the forge-app fix scripts.
+ *
+ * Usage: node tsc_driver.cjs TSCONFIG TSBUILDINFO   (cwd = forge-app root)
+ *
+ * Loads the project's TypeScript once, then runs one incremental
+ * `tsc --noEmit --pretty false` equivalent for every line read on stdin and
+ * prints PASS_DONE after its diagnostics. A pass only starts when the caller
+ * asks for it, so it always sees every edit made before the request. Each
+ * pass builds on the previous builder program and reuses the parsed source
+ * of every file whose text is unchanged.
+ */
+
+const path = require('path');
+const readline = require('readline');
+
+const ts = require(path.join(process.cwd(), 'node_modules', 'typescript'));
+
+const [configPath, buildInfoPath] = process.argv.slice(2);
+const PASS_DONE = '__forge_fix_pass_done__';
+
+const formatHost = {
+  getCurrentDirectory: () => ts.sys.getCurrentDirectory(),
+  getCanonicalFileName: (f) => (ts.sys.useCaseSensitiveFileNames ? f : f.toLowerCase()),
+  getNewLine: () => ts.sys.newLine,
+};
+
+const sourceCache = new Map();
+let builder;
+
+function cachingHost(options) {
+  const host = ts.createIncrementalCompilerHost(options);
+  const getSourceFile = host.getSourceFile;
+  host.getSourceFile = (fileName, languageVersion, onError, shouldCreate) => {
+    const text = host.readFile(fileName);
+    const hit = sourceCache.get(fileName);
+    if (hit && text !== undefined && hit.text === text) {
+      return hit;
+    }
+    const sf = getSourceFile.call(host, fileName, languageVersion, onError, shouldCreate);
+    if (sf) {
+      sourceCache.set(fileName, sf);
+    } else {
+      sourceCache.delete(fileName);
+    }
+    return sf;
+  };
+  return host;
+}
+
+function check() {
+  const configDiagnostics = [];
+  const config = ts.getParsedCommandLineOfConfigFile(
+    configPath,
+    { noEmit: true, incremental: true, tsBuildInfoFile: buildInfoPath },
+    { ...ts.sys, onUnRecoverableConfigFileDiagnostic: (d) => configDiagnostics.push(d) },
+  );
+  if (!config) {
+    return configDiagnostics;
+  }
+  const host = cachingHost(config.options);
+  // the first pass picks up the .tsbuildinfo left by earlier runs
+  const old = builder || ts.readBuilderProgram(config.options, host);
+  builder = ts.createEmitAndSemanticDiagnosticsBuilderProgram(
+    config.fileNames, config.options, host, old, ts.getConfigFileParsingDiagnostics(config), config.projectReferences,
+  );
+  // same order and short-circuits as tsc: options, global and semantic
+  // diagnostics are only collected while nothing worse has been reported
+  const diagnostics = builder.getConfigFileParsingDiagnostics().slice();
+  const configCount = diagnostics.length;
+  diagnostics.push(...builder.getSyntacticDiagnostics());
+  if (diagnostics.length === configCount) {
+    diagnostics.push(...builder.getOptionsDiagnostics(), ...builder.getGlobalDiagnostics());
+    if (diagnostics.length === configCount) {
+      diagnostics.push(...builder.getSemanticDiagnostics());
+    }
+  }
+  // with noEmit this only writes the .tsbuildinfo, as tsc does
+  diagnostics.push(...builder.emit().diagnostics);
+  return ts.sortAndDeduplicateDiagnostics(diagnostics);
+}
+
+readline.createInterface({ input: process.stdin }).on('line', () => {
+  const diagnostics = check();
+  const errors = diagnostics.filter((d) => d.category === ts.DiagnosticCategory.Error).length;
+  process.stdout.write(
+    ts.formatDiagnostics(diagnostics, formatHost)
+      + `\nFound ${errors} error${errors === 1 ? '' : 's'}.\n`
+      + `${PASS_DONE}\n`,
+  );
+});
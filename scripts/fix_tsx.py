@@ -2,6 +2,15 @@
 from pathlib import Path
 import sys
 
+
+def _read(p):
+    return p.read_bytes().decode('utf-8', 'replace')
+
+
+def _write(p, s):
+    p.write_bytes(s.encode('utf-8'))
+
+
 if len(sys.argv) < 2:
     print('Usage: fix_tsx.py <file>')
     sys.exit(2)
@@ -11,23 +20,25 @@ if not p.exists():
     print('MISSING', p)
     sys.exit(0)
 
-txt = p.read_text(encoding='utf-8', errors='replace')
+txt = _read(p)
 orig = txt
 changed = False
+# _read keeps CRLF as-is, so inserted lines end the way the file does
+nl = '\r\n' if '\r\n' in txt else '\n'
 
 # Add React default import if missing
 if 'import React' not in txt and 'from "react"' not in txt and "from 'react'" not in txt:
-    txt = 'import React from "react";\n' + txt
+    txt = 'import React from "react";' + nl + txt
     changed = True
 
 # If file uses JSX factory `view` ensure it is imported from @forge/ui (if not already)
 if ('view(' in txt or '<View' in txt or '<view' in txt) and ('from "@forge/ui"' not in txt and "from '@forge/ui'" not in txt):
-    txt = 'import { view } from "@forge/ui";\n' + txt
+    txt = 'import { view } from "@forge/ui";' + nl + txt
     changed = True
 
 # Write back if changed
 if changed and txt != orig:
-    p.write_text(txt, encoding='utf-8')
+    _write(p, txt)
     print('Updated imports in', p)
 else:
     print('No import changes needed for', p)